@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import logging
 import sys
 from datetime import datetime, timedelta
@@ -12,9 +13,9 @@ def parse_arguments():
     
     # Selection Arguments
     parser.add_argument("--project", required=True, help="GCP Project ID searching for backups.")
-    parser.add_argument("--location", required=True, help="Lossation/Region to search (e.g., asia-southeast1). Use '-' for all.")
+    parser.add_argument("--location", required=True, help="Location/Region to search (e.g., asia-southeast1). Comma-separate several, or use '-' for all.")
     parser.add_argument("--vault", help="Filter by specific Backup Vault name.")
-    parser.add_argument("--workload-type", help="Filter by workload type (e.g., COMPUTE_ENGINE_INSTANCE, CLOUD_SQL_INSTANCE).")
+    parser.add_argument("--workload-type", help="Filter by workload type. Comma-separate to match any of several (e.g., COMPUTE_ENGINE_INSTANCE,CLOUD_SQL_INSTANCE).")
     
     # Filter Arguments
     parser.add_argument("--filter-age-days", type=int, default=0, help="Only select backups older than X days.")
@@ -31,8 +32,19 @@ def parse_arguments():
     parser.add_argument("--execute", action="store_true", help="Execute changes. MUST be specified to run updates.")
     parser.add_argument("--verbose", action="store_true", help="Print detailed curl equivalent commands.")
     parser.add_argument("--gcloud", action="store_true", help="Print detailed gcloud equivalent commands.")
+    parser.add_argument("--debug", action="store_true", help="Log per-RPC latency and retry counts.")
+    parser.add_argument("--output", choices=["table", "csv", "json"], default="table", help="Summary format. 'json' emits one JSON object per line.")
+    parser.add_argument("--rest-batch", action="store_true", help="Send updates as batched REST PATCH requests (100 per batch) instead of individual gRPC calls.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Discover backups with the asyncio client. Scales better to thousands of vaults, but collects\nthe full backup list in memory before processing instead of streaming it.")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the local vault/datasource cache and always query the API.")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="Maximum number of backup updates run in parallel.")
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.workload_type is not None and not any(t.strip() for t in args.workload_type.split(",")):
+        parser.error("--workload-type must name at least one workload type.")
+    if args.max_concurrency < 1:
+        parser.error("--max-concurrency must be at least 1.")
+    return args
 
 def main():
     args = parse_arguments()
@@ -44,61 +56,80 @@ def main():
     )
     
     logger = logging.getLogger(__name__)
+    if args.debug:
+        logging.getLogger("retention_manager").setLevel(logging.DEBUG)
     
     if not args.execute:
         logger.info("DRY-RUN MODE: No changes will be applied.")
     
-    manager = RetentionManager(project_id=args.project, location=args.location, verbose=args.verbose, gcloud_verbose=args.gcloud, dry_run=not args.execute)
+    with RetentionManager(project_id=args.project, location=args.location, verbose=args.verbose, gcloud_verbose=args.gcloud, dry_run=not args.execute, max_concurrency=args.max_concurrency, use_cache=not args.no_cache, rest_batch=args.rest_batch, output=args.output) as manager:
     
-    # 1. Discovery
-    logger.info(f"Discovering backups in project {args.project} location {args.location}...")
-    # Parse labels if provided
-    label_filter = {}
-    if args.filter_labels:
-        for label in args.filter_labels:
-            try:
-                key, value = label.split("=")
-                label_filter[key] = value
-            except ValueError:
-                logger.error(f"Invalid label format: {label}. Expected key=value.")
-                sys.exit(1)
+        # 1. Discovery
+        logger.info(f"Discovering backups in project {args.project} location {args.location}...")
+        # Parse labels if provided
+        label_filter = {}
+        if args.filter_labels:
+            for label in args.filter_labels:
+                try:
+                    key, value = label.split("=")
+                    label_filter[key] = value
+                except ValueError:
+                    logger.error(f"Invalid label format: {label}. Expected key=value.")
+                    sys.exit(1)
 
-    backups = manager.list_backups(
-        vault_filter=args.vault,
-        workload_type_filter=args.workload_type,
-        age_days_filter=args.filter_age_days,
-        name_filter=args.filter_name,
-        label_filter=label_filter
-    )
-    
-    if not backups:
-        logger.info("No matching backups found.")
-        sys.exit(0)
-        
-    logger.info(f"Found {len(backups)} backups matching criteria.")
+        list_kwargs = dict(
+            vault_filter=args.vault,
+            workload_type_filter=args.workload_type,
+            age_days_filter=args.filter_age_days,
+            name_filter=args.filter_name,
+            label_filter=label_filter
+        )
+        if args.use_async:
+            backups = asyncio.run(manager.list_backups_async(**list_kwargs))
+        else:
+            backups = manager.list_backups(**list_kwargs)
     
-    # 2. Planning
-    updates = []
-    for backup in backups:
-        current_expire_time = backup.get('expireTime')
-        if not current_expire_time:
-            logger.warning(f"Skipping backup {backup['name']} - No expireTime found.")
-            continue
+        # 2. Planning
+        found = 0
+
+        def plan(backup):
+            nonlocal found
+            found += 1
+            current_expire_time = backup.expire_time
+            if not current_expire_time:
+                logger.warning(f"Skipping backup {backup.name} - No expireTime found.")
+                return None
             
-        new_expire_time = manager.calculate_new_expiration(
-            current_expire_time,
-            add_days=args.add_expiration_days,
-            set_date=args.set_new_expiration_date
-        )
+            new_expire_time = manager.calculate_new_expiration(
+                current_expire_time,
+                add_days=args.add_expiration_days,
+                set_date=args.set_new_expiration_date
+            )
         
-        updates.append({
-            'backup': backup,
-            'current_expire': current_expire_time,
-            'new_expire': new_expire_time
-        })
+            return {
+                'backup': backup,
+                'current_expire': current_expire_time,
+                'new_expire': new_expire_time
+            }
+
+        # 3. Execution / Reporting
+        # Discovery, planning and execution are chained generators; list_backups
+        # bounds how many datasource listings are buffered ahead of this loop.
+        updates = (update for update in map(plan, backups) if update)
+        processed = manager.process_updates(updates)
+
+        if not found:
+            logger.info("No matching backups found.")
+            sys.exit(0)
         
-    # 3. Execution / Reporting
-    manager.process_updates(updates)
+        logger.info(f"Found {found} backups matching criteria, processed {processed}.")
+
+        if not args.execute:
+            if args.output == "table":
+                print("\n[DRY RUN] No changes were applied. Run with --execute to apply.")
+            else:
+                # Keep stdout clean for csv/json consumers
+                logger.info("[DRY RUN] No changes were applied. Run with --execute to apply.")
 
 if __name__ == "__main__":
     main()
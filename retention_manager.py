@@ -1,129 +1,670 @@
+import asyncio
+import csv
+import hashlib
 import logging
-from datetime import datetime, timedelta
-from dateutil import parser
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from google.cloud import backupdr_v1
-from google.api_core import client_options
+from google.cloud.location import locations_pb2
+from google.api_core import client_options, exceptions, retry, retry_async
+from google.protobuf.field_mask_pb2 import FieldMask
 from tabulate import tabulate
 import json
 
+# Page size for List* RPCs. The server default is much smaller, which multiplies
+# round-trips on large estates.
+PAGE_SIZE = 1000
+
+# Per-attempt timeout for BackupDR RPCs; retries are bounded by RETRY_DEADLINE_SECONDS.
+RPC_TIMEOUT_SECONDS = 60.0
+RETRY_DEADLINE_SECONDS = 300.0
+RETRYABLE_ERRORS = (exceptions.ServiceUnavailable, exceptions.DeadlineExceeded, exceptions.Aborted)
+
+# Maximum in-flight RPCs for list_backups_async.
+ASYNC_MAX_CONCURRENCY = 64
+
+# Upper bound on how long to wait for a single update_backup LRO.
+LRO_TIMEOUT_SECONDS = 600
+
+# Maximum sub-requests per REST batch request (API limit is 100).
+REST_BATCH_SIZE = 100
+
+# Above this many rows the summary is streamed instead of tabulated.
+TABULATE_MAX_ROWS = 500
+# Number of planned updates applied at a time while the pipeline is running.
+APPLY_BATCH_SIZE = 500
+TABLE_HEADERS = ["Backup Name", "Current Expiry", "New Expiry"]
+STREAM_ROW_FORMAT = "{:<60}  {:<32}  {:<32}"
+
+# Local cache of vault/datasource topology, refreshed after CACHE_TTL_SECONDS.
+CACHE_DIR = Path.home() / '.gcbdr_cache'
+CACHE_TTL_SECONDS = 600
+
+# ListBackupsRequest has no read_mask, so the response is trimmed with the
+# X-Goog-FieldMask system parameter. Only the fields BackupRow and the
+# client-side matcher read are returned; next_page_token keeps pagination working.
+LIST_BACKUPS_FIELD_MASK = FieldMask(paths=[
+    "backups.name",
+    "backups.expire_time",
+    "backups.create_time",
+    "backups.state",
+    "backups.labels",
+    "next_page_token",
+])
+LIST_BACKUPS_METADATA = (("x-goog-fieldmask", ",".join(LIST_BACKUPS_FIELD_MASK.paths)),)
+
+# Label keys that can be written as a bare labels.<key> filter identifier.
+# Any other valid key (e.g. with '-' or international characters) is only
+# matched client-side.
+FILTER_LABEL_KEY_RE = re.compile(r'^[a-z][a-z0-9_]{0,62}$')
+
+# Workload Type Map (Friendly Name -> API Substring)
+WORKLOAD_TYPE_MAP = {
+    "COMPUTE_ENGINE_INSTANCE": "compute.googleapis.com/Instance",
+    "COMPUTE_ENGINE_DISK": "compute.googleapis.com/Disk",
+    "CLOUD_SQL_INSTANCE": "sqladmin.googleapis.com/Instance",
+    "ALLOY_DB_CLUSTER": "alloydb.googleapis.com/Cluster",
+    "FILESTORE_INSTANCE": "file.googleapis.com/Instance"
+}
+
+class BackupRow(namedtuple('BackupRow', 'name expire_time create_time state')):
+    """Lightweight view of a Backup proto; timestamps stay as datetimes."""
+    __slots__ = ()
+
+    @classmethod
+    def from_proto(cls, backup):
+        return cls(backup.name, backup.expire_time, backup.create_time, backup.state)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'expireTime': self.expire_time.isoformat() if self.expire_time else None,
+            'createTime': self.create_time.isoformat() if self.create_time else None,
+            'state': self.state.name
+        }
+
+def _make_retry(retry_cls=retry.Retry, on_error=None):
+    # Exponential backoff (1s doubling to 30s, with jitter) on transient errors only.
+    return retry_cls(
+        predicate=retry.if_exception_type(*RETRYABLE_ERRORS),
+        initial=1.0,
+        maximum=30.0,
+        multiplier=2.0,
+        deadline=RETRY_DEADLINE_SECONDS,
+        on_error=on_error
+    )
+
+class _RpcLogAdapter(logging.LoggerAdapter):
+    """Prefixes messages with the RPC name so per-call timings are easy to grep."""
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['rpc']}] {msg}", kwargs
+
+class _CacheStore:
+    """
+    JSON file holding the vault -> datasource names discovered for one
+    (project, location, vault filter, workload type) combination.
+    """
+
+    def __init__(self, path, ttl=CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def for_key(cls, project_id, location, vault_filter, workload_pattern):
+        # Filters change which vaults/datasources are kept, so they are part of the key.
+        digest = hashlib.sha1(json.dumps([vault_filter, workload_pattern]).encode()).hexdigest()[:12]
+        location_key = 'all' if location == '-' else location
+        return cls(CACHE_DIR / f"{project_id}_{location_key}_{digest}.json")
+
+    def load(self):
+        """Returns {vault_name: [ds_name, ...]} or None if missing or stale."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Anything that is not the shape save() writes is treated as a miss.
+        if not isinstance(data, dict) or not isinstance(data.get('datasources'), dict):
+            return None
+        ts = data.get('ts')
+        if not isinstance(ts, (int, float)) or time.time() - ts >= self.ttl:
+            return None
+        return data['datasources']
+
+    def save(self, datasources):
+        # Write to a temp file and rename so concurrent runs never see a partial file.
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'ts': time.time(), 'vaults': list(datasources), 'datasources': datasources}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not write metadata cache {self.path}: {e}")
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Returns the process-wide BackupDRClient, creating it on first use so every
+    RetentionManager (e.g. one per location) reuses the same gRPC channel.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            # The gRPC transport multiplexes concurrent calls from the worker
+            # threads over a single shared channel.
+            _client = backupdr_v1.BackupDRClient(transport="grpc")
+        return _client
+
 class RetentionManager:
-    def __init__(self, project_id, location, verbose=False, gcloud_verbose=False, dry_run=True):
+    def __init__(self, project_id, location, verbose=False, gcloud_verbose=False, dry_run=True, max_workers=16, max_concurrency=32, use_cache=True, rest_batch=False, output='table'):
         self.project_id = project_id
         self.location = location
         self.verbose = verbose
         self.gcloud_verbose = gcloud_verbose
         self.dry_run = dry_run
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.use_cache = use_cache
+        self._server_filter_rejected = False
+        self.rest_batch = rest_batch
+        self._rest_service = None
+        self.output = output
+        self._csv_writer = None
+        self._stream_header_printed = False
         self.logger = logging.getLogger(__name__)
         
-        # Initialize BackupDR Client
-        # We might need to iterate over vaults if location is wildcard
-        self.client = backupdr_v1.BackupDRClient()
+        # Initialize BackupDR Client (shared process-wide, see get_client)
+        self.client = get_client()
+
+        # Discovery RPCs are I/O bound; the client shares one channel and is
+        # safe to use from multiple threads.
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def close(self):
+        """Shuts down the discovery thread pool. The shared client stays open."""
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def list_backups(self, vault_filter=None, workload_type_filter=None, age_days_filter=0, name_filter=None, label_filter=None):
         """
         Enumerates backups across vaults in the specified project and location.
         Note: The API structure is Project -> Location -> BackupVault -> DataSource -> Backup.
         Listing all backups directly might require listing vaults first.
+
+        Locations, Vaults and DataSources are independent of each other, so the
+        per-location Vault listing, per-vault DataSource listing and
+        per-DataSource Backup listing are fanned out across the executor. A
+        failure in one location, vault or DataSource is logged and does not
+        abort the rest of the discovery.
+
+        Matching backups are yielded as each DataSource finishes, while vault
+        and DataSource discovery is still running. At most max_workers
+        DataSource listings are in flight or awaiting consumption, so memory is
+        bounded by that many DataSources' matches rather than the whole result
+        set. The (name-only) vault/datasource topology is still held in full.
         """
-        backups = []
-        
-        # 1. List Vaults
-        parent = f"projects/{self.project_id}/locations/{self.location}"
-        
-        # Workload Type Map (Friendly Name -> API Substring)
-        WORKLOAD_TYPE_MAP = {
-            "COMPUTE_ENGINE_INSTANCE": "compute.googleapis.com/Instance",
-            "COMPUTE_ENGINE_DISK": "compute.googleapis.com/Disk",
-            "CLOUD_SQL_INSTANCE": "sqladmin.googleapis.com/Instance",
-            "ALLOY_DB_CLUSTER": "alloydb.googleapis.com/Cluster",
-            "FILESTORE_INSTANCE": "file.googleapis.com/Instance"
-        }
+        workload_re, backup_filter, matches = self._prepare_listing(
+            workload_type_filter, age_days_filter, name_filter, label_filter
+        )
+
+        # Backup listings wait in a queue and at most max_workers run at once.
+        # The queue is only refilled as the caller consumes results, so a slow
+        # consumer (e.g. --execute waiting on LROs) holds backup listing back
+        # instead of letting completed listings pile up in memory.
+        queued_ds_names = deque()
+        backup_futures = {}
+
+        def refill():
+            while queued_ds_names and len(backup_futures) < self.max_workers:
+                ds_name = queued_ds_names.popleft()
+                backup_future = self._executor.submit(
+                    self._list_backups_for_data_source, ds_name, backup_filter, matches
+                )
+                backup_futures[backup_future] = ds_name
+
+        # 1. List Vaults (one task per location without a fresh cache entry)
+        vault_futures = {}
+        for location in self._resolve_locations():
+            cache, topology = self._load_topology(location, vault_filter, workload_re)
+            if topology is not None:
+                for ds_names in topology.values():
+                    queued_ds_names.extend(ds_names)
+            else:
+                vault_future = self._executor.submit(self._list_vaults, location, vault_filter)
+                vault_futures[vault_future] = (location, cache)
+        refill()
+
+        # 2. List DataSources in each Vault (one task per vault) and
+        # 3. List Backups in each DataSource (one task per datasource).
+        # All three stages are waited on together, so backups are yielded as
+        # soon as their DataSource is listed rather than after discovery ends.
+        ds_futures = {}
+        discovered = {}
+
+        def save_if_discovered(location):
+            state = discovered[location]
+            if not state['pending']:
+                self._save_topology(state['cache'], state['topology'], state['complete'])
+
+        while vault_futures or ds_futures or backup_futures:
+            done, _ = wait([*vault_futures, *ds_futures, *backup_futures], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in vault_futures:
+                    location, cache = vault_futures.pop(future)
+                    try:
+                        vault_names = future.result()
+                    except Exception as e:
+                        self.logger.error(f"Error listing backup vaults in {location}: {e}")
+                        continue
+
+                    discovered[location] = {'cache': cache, 'topology': {}, 'complete': True, 'pending': len(vault_names)}
+                    for vault_name in vault_names:
+                        ds_future = self._executor.submit(self._list_data_sources_for_vault, vault_name, workload_re)
+                        ds_futures[ds_future] = (location, vault_name)
+                    save_if_discovered(location)
+
+                elif future in ds_futures:
+                    location, vault_name = ds_futures.pop(future)
+                    discovered[location]['pending'] -= 1
+                    try:
+                        ds_names = future.result()
+                    except Exception as e:
+                        self.logger.error(f"Error listing data sources in {vault_name}: {e}")
+                        discovered[location]['complete'] = False
+                    else:
+                        discovered[location]['topology'][vault_name] = ds_names
+                        queued_ds_names.extend(ds_names)
+                    save_if_discovered(location)
+
+                else:
+                    # Drop the future once consumed so its rows can be freed after they are yielded.
+                    ds_name = backup_futures.pop(future)
+                    try:
+                        ds_backups = future.result()
+                    except Exception as e:
+                        self.logger.error(f"Error listing backups in {ds_name}: {e}")
+                        continue
+
+                    yield from ds_backups
+            refill()
+
+    async def list_backups_async(self, vault_filter=None, workload_type_filter=None, age_days_filter=0, name_filter=None, label_filter=None):
+        """
+        asyncio variant of list_backups for very wide estates.
+        Uses BackupDRAsyncClient so all location/vault/datasource RPCs are
+        multiplexed on one event loop instead of one thread each, bounded by a
+        semaphore. Returns a list of BackupRow: unlike list_backups, the full
+        result set is materialized before anything is planned or applied.
+        """
+        workload_re, backup_filter, matches = self._prepare_listing(
+            workload_type_filter, age_days_filter, name_filter, label_filter
+        )
+        locations = await asyncio.get_running_loop().run_in_executor(self._executor, self._resolve_locations)
+
+        # The async client binds to the running event loop, so it is created here.
+        client = backupdr_v1.BackupDRAsyncClient()
+        semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+
+        async def fetch_backup_rows(ds_name, ds_filter):
+            request = self._backups_request(ds_name, ds_filter)
+            return [
+                BackupRow.from_proto(backup)
+                async for backup in self._list_async(client, "list_backups", ds_name, request, LIST_BACKUPS_METADATA)
+                if matches(backup)
+            ]
+
+        async def list_data_source(ds_name):
+            ds_filter = self._effective_backup_filter(backup_filter)
+            async with semaphore:
+                try:
+                    try:
+                        return await fetch_backup_rows(ds_name, ds_filter)
+                    except exceptions.InvalidArgument as e:
+                        if not self._reject_server_filter(ds_filter, e):
+                            raise
+                        return await fetch_backup_rows(ds_name, "")
+                except Exception as e:
+                    self.logger.error(f"Error listing backups in {ds_name}: {e}")
+                    return []
+
+        async def list_data_sources(ds_names):
+            results = await asyncio.gather(*(list_data_source(ds_name) for ds_name in ds_names))
+            return [row for rows in results for row in rows]
+
+        # The semaphore is released before fanning out to child tasks so parent
+        # tasks never hold a slot their children are waiting for.
+        async def list_vault(vault_name):
+            async with semaphore:
+                try:
+                    request = self._data_sources_request(vault_name)
+                    ds_names = [
+                        ds.name async for ds in self._list_async(client, "list_data_sources", vault_name, request)
+                        if self._matches_workload(ds, workload_re)
+                    ]
+                except Exception as e:
+                    self.logger.error(f"Error listing data sources in {vault_name}: {e}")
+                    return None, []
+
+            return ds_names, await list_data_sources(ds_names)
+
+        async def list_location(location):
+            cache, topology = self._load_topology(location, vault_filter, workload_re)
+            if topology is not None:
+                return await list_data_sources([ds_name for names in topology.values() for ds_name in names])
+
+            parent, request = self._vaults_request(location)
+            async with semaphore:
+                try:
+                    vault_names = [
+                        vault.name async for vault in self._list_async(client, "list_backup_vaults", parent, request)
+                        if self._matches_vault(vault, vault_filter)
+                    ]
+                except Exception as e:
+                    self.logger.error(f"Error listing backup vaults in {location}: {e}")
+                    return []
+
+            results = await asyncio.gather(*(list_vault(vault_name) for vault_name in vault_names))
+            self._save_topology(
+                cache,
+                {vault_name: ds_names for vault_name, (ds_names, _) in zip(vault_names, results) if ds_names is not None},
+                complete=all(ds_names is not None for ds_names, _ in results)
+            )
+
+            return [row for _, rows in results for row in rows]
 
         try:
-            request = backupdr_v1.ListBackupVaultsRequest(parent=parent)
-            vaults = self.client.list_backup_vaults(request=request)
-            
-            for vault in vaults:
-                if vault_filter and vault_filter not in vault.name:
-                    continue
-                
-                # 2. List DataSources in Vault
-                ds_request = backupdr_v1.ListDataSourcesRequest(parent=vault.name)
-                data_sources = self.client.list_data_sources(request=ds_request)
-                
-                for ds in data_sources:
-                    # Filter by Workload Type
-                    if workload_type_filter:
-                        # Normalize to map value if possible, else use raw input
-                        target_type = WORKLOAD_TYPE_MAP.get(workload_type_filter, workload_type_filter)
-                        
-                        # Check GCP Resource Type
-                        if hasattr(ds, 'data_source_gcp_resource') and hasattr(ds.data_source_gcp_resource, 'type'):
-                            if target_type not in ds.data_source_gcp_resource.type:
-                                continue
-                        else:
-                             # If type info is missing but filter is requested, verify if we should skip
-                             # Some datasources might not be GCP resources (e.g. on-prem).
-                             # For now, skip if we can't verify type
-                             continue
-
-                    # 3. List Backups in DataSource
-
-                    # Creating a backup list request
-                    
-                    backup_request = backupdr_v1.ListBackupsRequest(parent=ds.name)
-                    # We can use 'filter' parameter here if the API supports it to optimize
-                    # e.g., filter="create_time < ..."
-                    
-                    ds_backups = self.client.list_backups(request=backup_request)
-                    for backup in ds_backups:
-                        # Client side filtering for now for flexibility
-                        if self._matches_criteria(backup, age_days_filter, name_filter, label_filter):
-                            backups.append(self._proto_to_dict(backup))
-                            
+            results = await asyncio.gather(*(list_location(location) for location in locations))
+            return [row for rows in results for row in rows]
+        finally:
+            await client.transport.close()
+
+    def _resolve_locations(self):
+        """
+        Expands the configured location into the list of locations to scan.
+        '-' is expanded via the Locations API rather than relying on the server
+        wildcard, and a comma-separated value is split.
+        """
+        if self.location != '-':
+            return [location.strip() for location in self.location.split(',') if location.strip()]
+
+        try:
+            locations = []
+            parent = f"projects/{self.project_id}"
+            request = locations_pb2.ListLocationsRequest(name=parent)
+            while True:
+                # list_locations returns a raw response rather than a pager, so
+                # each page is one retried unary call.
+                response = self._call("list_locations", parent, request)
+                locations.extend(location.location_id for location in response.locations)
+                if not response.next_page_token:
+                    break
+                request.page_token = response.next_page_token
         except Exception as e:
-            self.logger.error(f"Error listing backups: {e}")
-            
-        return backups
+            self.logger.warning(f"Could not list locations, falling back to the '-' wildcard: {e}")
+            return ['-']
 
-    def _matches_criteria(self, backup, age_days_filter, name_filter, label_filter):
-        if age_days_filter > 0:
-            create_time = backup.create_time
-            if not create_time:
-                return False
-            age = datetime.now(create_time.tzinfo) - create_time
-            if age.days < age_days_filter:
-                return False
+        self.logger.info(f"Scanning {len(locations)} locations.")
+        return locations
+
+    # Request builders, filters and topology cache handling below are shared by
+    # list_backups and list_backups_async so the two paths cannot drift apart.
+
+    def _vaults_request(self, location):
+        parent = f"projects/{self.project_id}/locations/{location}"
+        return parent, backupdr_v1.ListBackupVaultsRequest(parent=parent, page_size=PAGE_SIZE)
+
+    @staticmethod
+    def _data_sources_request(vault_name):
+        return backupdr_v1.ListDataSourcesRequest(parent=vault_name, page_size=PAGE_SIZE)
+
+    @staticmethod
+    def _backups_request(ds_name, backup_filter):
+        return backupdr_v1.ListBackupsRequest(parent=ds_name, filter=backup_filter, page_size=PAGE_SIZE)
+
+    @staticmethod
+    def _matches_vault(vault, vault_filter):
+        return not vault_filter or vault_filter in vault.name
+
+    def _load_topology(self, location, vault_filter, workload_re):
+        """Returns (cache, topology); topology is None on a miss or with caching disabled."""
+        cache = self._topology_cache(location, vault_filter, workload_re)
+        topology = cache.load() if cache else None
+        if topology is not None:
+            self.logger.info(f"Using cached vault/datasource list from {cache.path}")
+        return cache, topology
+
+    @staticmethod
+    def _save_topology(cache, topology, complete):
+        # Only cache a complete view; a partial one would hide vaults until the TTL expires.
+        if cache and complete:
+            cache.save(topology)
+
+    def _list_vaults(self, location, vault_filter):
+        parent, request = self._vaults_request(location)
+        return [
+            vault.name for vault in self._list("list_backup_vaults", parent, request)
+            if self._matches_vault(vault, vault_filter)
+        ]
+
+    def _call(self, rpc_name, target, request, metadata=()):
+        """
+        Invokes a unary BackupDR client RPC with retry/timeout and logs its
+        latency and retry count. Successful calls without retries are logged at DEBUG.
+        """
+        errors = []
+        start = time.monotonic()
+        try:
+            return getattr(self.client, rpc_name)(
+                request=request, retry=_make_retry(on_error=errors.append), timeout=RPC_TIMEOUT_SECONDS, metadata=metadata
+            )
+        finally:
+            self._log_rpc(rpc_name, target, time.monotonic() - start, errors)
+
+    def _list(self, rpc_name, target, request, metadata=()):
+        """
+        Like _call for paginated list_* RPCs, yielding every item. The pager
+        fetches later pages lazily with the same retry, so latency and retries
+        are logged once all pages have been consumed.
+        """
+        errors = []
+        start = time.monotonic()
+        try:
+            yield from getattr(self.client, rpc_name)(
+                request=request, retry=_make_retry(on_error=errors.append), timeout=RPC_TIMEOUT_SECONDS, metadata=metadata
+            )
+        finally:
+            self._log_rpc(rpc_name, target, time.monotonic() - start, errors)
+
+    async def _list_async(self, client, rpc_name, target, request, metadata=()):
+        errors = []
+        start = time.monotonic()
+        try:
+            pager = await getattr(client, rpc_name)(
+                request=request,
+                retry=_make_retry(retry_async.AsyncRetry, on_error=errors.append),
+                timeout=RPC_TIMEOUT_SECONDS,
+                metadata=metadata
+            )
+            async for item in pager:
+                yield item
+        finally:
+            self._log_rpc(rpc_name, target, time.monotonic() - start, errors)
+
+    def _log_rpc(self, rpc_name, target, elapsed, errors):
+        log = _RpcLogAdapter(self.logger, {'rpc': rpc_name})
+        if errors:
+            log.warning(f"{target}: {elapsed:.2f}s after {len(errors)} retries (last error: {errors[-1]})")
+        else:
+            log.debug(f"{target}: {elapsed:.2f}s")
+
+    def _prepare_listing(self, workload_type_filter, age_days_filter, name_filter, label_filter):
+        """
+        Resolves the per-run filter state shared by list_backups and
+        list_backups_async: (workload_re, backup_filter, matches).
+        """
+        workload_re = self._compile_workload_types(workload_type_filter)
+
+        # The age cutoff is invariant for the run, so it is computed once here and
+        # shared by the server-side filter and the client-side matcher.
+        age_cutoff = datetime.now(timezone.utc) - timedelta(days=age_days_filter) if age_days_filter > 0 else None
+        # Predicates pushed down to the ListBackups call so non-matching backups
+        # are never sent over the wire.
+        backup_filter = self._build_backup_filter(age_cutoff, name_filter, label_filter)
+        matches = self._build_matcher(age_cutoff, name_filter, label_filter)
+
+        return workload_re, backup_filter, matches
+
+    def _topology_cache(self, location, vault_filter, workload_re):
+        # Vault/DataSource topology changes rarely, so it is served from the
+        # on-disk cache when fresh. Backups themselves are always listed live.
+        if not self.use_cache:
+            return None
+        return _CacheStore.for_key(self.project_id, location, vault_filter, workload_re and workload_re.pattern)
+
+    def _list_data_sources_for_vault(self, vault_name, workload_re):
+        data_sources = self._list("list_data_sources", vault_name, self._data_sources_request(vault_name))
+
+        return [ds.name for ds in data_sources if self._matches_workload(ds, workload_re)]
+
+    @staticmethod
+    def _matches_workload(ds, workload_re):
+        # Filter by Workload Type
+        # If type info is missing but filter is requested, skip the datasource:
+        # some datasources might not be GCP resources (e.g. on-prem).
+        # proto-plus auto-creates submessages on attribute access, so presence is
+        # checked on the raw protobuf instead.
+        if not workload_re:
+            return True
+        if not ds._pb.HasField('data_source_gcp_resource'):
+            return False
+        return bool(workload_re.search(ds.data_source_gcp_resource.type))
+
+    def _list_backups_for_data_source(self, ds_name, backup_filter, matches):
+        backup_filter = self._effective_backup_filter(backup_filter)
+        try:
+            return self._fetch_backup_rows(ds_name, backup_filter, matches)
+        except exceptions.InvalidArgument as e:
+            if not self._reject_server_filter(backup_filter, e):
+                raise
+            return self._fetch_backup_rows(ds_name, "", matches)
+
+    def _fetch_backup_rows(self, ds_name, backup_filter, matches):
+        backup_request = self._backups_request(ds_name, backup_filter)
         
+        matched = []
+        ds_backups = self._list("list_backups", ds_name, backup_request, LIST_BACKUPS_METADATA)
+        for backup in ds_backups:
+            # Client side check kept as a safety net for anything the server filter missed
+            if matches(backup):
+                matched.append(BackupRow.from_proto(backup))
+        return matched
+
+    def _effective_backup_filter(self, backup_filter):
+        return "" if self._server_filter_rejected else backup_filter
+
+    def _reject_server_filter(self, backup_filter, error):
+        """
+        Records that the server refused backup_filter. Returns False when there
+        was no filter to drop, i.e. the InvalidArgument has another cause.
+        """
+        if not backup_filter:
+            return False
+        # The client-side matcher applies the same criteria, so a filter the
+        # server refuses only costs bandwidth, not correctness.
+        if not self._server_filter_rejected:
+            self._server_filter_rejected = True
+            self.logger.warning(f"Server rejected backup filter '{backup_filter}' ({error}); filtering client-side instead.")
+        return True
+
+    @staticmethod
+    def _compile_workload_types(workload_type_filter):
+        """
+        Compiles a comma-separated list of workload types into one regex that
+        matches any of them. Returns None when no filter is given, and raises
+        ValueError for a value that names no types (e.g. ","), which would
+        otherwise compile to a pattern matching everything.
+        """
+        if not workload_type_filter:
+            return None
+        # Normalize to map value if possible, else use raw input
+        types = [t.strip() for t in workload_type_filter.split(',') if t.strip()]
+        if not types:
+            raise ValueError(f"No workload types in filter: {workload_type_filter!r}")
+        return re.compile('|'.join(re.escape(WORKLOAD_TYPE_MAP.get(t, t)) for t in types))
+
+    def _build_backup_filter(self, age_cutoff, name_filter, label_filter):
+        """
+        Builds an AIP-160 filter string for ListBackupsRequest.
+        Returns an empty string (no filtering) when no criteria are given.
+        """
+        clauses = []
+        if age_cutoff is not None:
+            clauses.append(f'create_time < "{age_cutoff.strftime("%Y-%m-%dT%H:%M:%SZ")}"')
+
         if name_filter:
-            if name_filter not in backup.name:
-                return False
+            clauses.append(f'name:"{self._quote_filter_value(name_filter)}"')
 
         if label_filter:
-            # backup.labels is a MutableMapping (dict-like)
-            # label_filter is assumed to be a dict or list of "key=value" strings
-            # If API doesn't return labels, we can't filter, so return False if labels required
-            if not backup.labels:
-                 return False
-            
             for key, value in label_filter.items():
-                if backup.labels.get(key) != value:
+                # Keys that are not plain filter identifiers are left to the
+                # client-side matcher rather than spliced into the filter string.
+                if FILTER_LABEL_KEY_RE.match(key):
+                    clauses.append(f'labels.{key}="{self._quote_filter_value(value)}"')
+
+        return " AND ".join(clauses)
+
+    @staticmethod
+    def _quote_filter_value(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"')
+
+    def _build_matcher(self, age_cutoff, name_filter, label_filter):
+        """
+        Returns a predicate over Backup protos with the criteria bound once,
+        so the per-row check does no clock reads or filter setup.
+        Proto Timestamps are tz-aware UTC, so they compare directly to age_cutoff.
+        """
+        label_items = tuple(label_filter.items()) if label_filter else ()
+
+        def matches(backup):
+            if age_cutoff is not None:
+                create_time = backup.create_time
+                if not create_time or create_time > age_cutoff:
+                    return False
+            
+            if name_filter and name_filter not in backup.name:
+                return False
+
+            if label_items:
+                # backup.labels is a MutableMapping (dict-like)
+                # If API doesn't return labels, we can't filter, so return False if labels required
+                labels = backup.labels
+                if not labels or not all(labels.get(key) == value for key, value in label_items):
                     return False
                     
-        return True
+            return True
 
-    def _proto_to_dict(self, backup):
-        # Convert necessary fields to dict for easier handling
-        return {
-            'name': backup.name,
-            'expireTime': backup.expire_time.isoformat() if backup.expire_time else None,
-            'createTime': backup.create_time.isoformat() if backup.create_time else None,
-            'state': backup.state.name
-        }
+        return matches
 
-    def calculate_new_expiration(self, current_expire_str, add_days=None, set_date=None):
-        current_expire = parser.parse(current_expire_str)
-        
+    def calculate_new_expiration(self, current_expire, add_days=None, set_date=None):
         if set_date:
             # Assume set_date is YYYY-MM-DD, preserve time info from current or set to EOD?
             # Usually better to preserve current time or set to 23:59:59
@@ -141,39 +682,153 @@ class RetentionManager:
         elif add_days:
             new_expire = current_expire + timedelta(days=add_days)
         else:
-            return current_expire_str
+            return current_expire
             
-        return new_expire.isoformat()
+        return new_expire
 
     def process_updates(self, updates):
+        """
+        Consumes an iterable of planned updates, reporting and (unless dry-run)
+        applying them as they arrive, so discovery, planning and execution run
+        as one pipeline. Returns the number of updates processed.
+        """
+        # Small tables are buffered and rendered with tabulate. Larger ones, and
+        # the machine readable formats, are written row by row as they are planned.
+        stream = self.output != 'table'
+        # curl/gcloud blocks would corrupt csv/json on stdout, so they go to stderr there.
+        command_out = sys.stdout if self.output == 'table' else sys.stderr
         table_data = []
+        pending = []
+        count = 0
         for update in updates:
-            backup_name = update['backup']['name']
-            current = update['current_expire']
-            new = update['new_expire']
+            count += 1
+            backup_name = update['backup'].name
+            current = update['current_expire'].isoformat()
+            new = update['new_expire'].isoformat()
             
-            table_data.append([
-                backup_name.split('/')[-1], # Short name
-                current,
-                new
-            ])
+            if stream:
+                self._emit_row(backup_name, current, new)
+            else:
+                table_data.append([backup_name, current, new])
+                if len(table_data) > TABULATE_MAX_ROWS:
+                    # Too many rows to buffer; flush and stream from here on.
+                    for row in table_data:
+                        self._emit_row(*row)
+                    table_data = []
+                    stream = True
             
             if self.verbose:
-                print(f"\n[VERBOSE] curl Command for {backup_name}:")
-                print(self._generate_curl_command(backup_name, new))
+                print(f"\n[VERBOSE] curl Command for {backup_name}:", file=command_out)
+                print(self._generate_curl_command(backup_name, new), file=command_out)
 
             if self.gcloud_verbose:
-                print(f"\n[GCLOUD] gcloud Command for {backup_name}:")
-                print(self._generate_gcloud_command(backup_name, new))
+                print(f"\n[GCLOUD] gcloud Command for {backup_name}:", file=command_out)
+                print(self._generate_gcloud_command(backup_name, new), file=command_out)
                 
             if not self.dry_run:
-                self._update_backup_expiration(backup_name, new)
-        
-        print("\nSummary of Changes:")
-        print(tabulate(table_data, headers=["Backup Name", "Current Expiry", "New Expiry"], tablefmt="grid"))
+                pending.append((backup_name, update['new_expire']))
+                if len(pending) >= APPLY_BATCH_SIZE:
+                    self._apply_pending(pending)
+                    pending = []
+
+        if pending:
+            self._apply_pending(pending)
         
-        if self.dry_run:
-             print("\n[DRY RUN] No changes were applied. Run with --execute to apply.")
+        if table_data:
+            print("\nSummary of Changes:")
+            table_data = [[name.split('/')[-1], current, new] for name, current, new in table_data] # Short name
+            print(tabulate(table_data, headers=TABLE_HEADERS, tablefmt="grid"))
+
+        return count
+
+    def _apply_pending(self, pending):
+        if self.rest_batch:
+            self._apply_updates_rest_batch(pending)
+        else:
+            self._apply_updates(pending)
+
+    def _emit_row(self, backup_name, current, new):
+        if self.output == 'json':
+            # JSON Lines, so output can be piped while batches are still running
+            print(json.dumps({'name': backup_name, 'currentExpireTime': current, 'newExpireTime': new}))
+            return
+
+        if self.output == 'csv':
+            if self._csv_writer is None:
+                self._csv_writer = csv.writer(sys.stdout)
+                self._csv_writer.writerow(['name', 'currentExpireTime', 'newExpireTime'])
+            self._csv_writer.writerow([backup_name, current, new])
+            return
+
+        if not self._stream_header_printed:
+            print("\nSummary of Changes:")
+            print(STREAM_ROW_FORMAT.format(*TABLE_HEADERS))
+            self._stream_header_printed = True
+        print(STREAM_ROW_FORMAT.format(backup_name.split('/')[-1], current, new))
+
+    def _apply_updates(self, pending):
+        # Each update is a Long-Running Operation. Issuing and waiting on them
+        # concurrently bounds wall time by the slowest LRO per wave of workers
+        # rather than the sum of all of them.
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for backup_name, new_expire_time in pending:
+                executor.submit(self._update_backup_expiration, backup_name, new_expire_time)
+
+    def _apply_updates_rest_batch(self, pending):
+        # REST alternative to _apply_updates: up to REST_BATCH_SIZE PATCH calls
+        # are packed into one multipart HTTP request. Batches are sent
+        # concurrently. The LROs are started but not waited on.
+        service, backups, new_http = self._get_rest_service()
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                self.logger.error(f"Failed to update {request_id}: {exception}")
+            else:
+                self.logger.info(f"Submitted update for {request_id} (operation {response.get('name')})")
+
+        def execute_batch(chunk):
+            batch = service.new_batch_http_request(callback=on_response)
+            for backup_name, new_expire_time in chunk:
+                batch.add(
+                    backups.patch(
+                        name=backup_name,
+                        updateMask="expireTime",
+                        body={"expireTime": new_expire_time.isoformat()}
+                    ),
+                    request_id=backup_name
+                )
+            batch.execute(http=new_http())
+
+        chunks = [pending[i:i + REST_BATCH_SIZE] for i in range(0, len(pending), REST_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = [executor.submit(execute_batch, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.logger.error(f"Batch update request failed: {e}")
+
+    def _get_rest_service(self):
+        """
+        Builds the discovery-based REST service on first use and reuses it for
+        every apply batch. Returns (service, backups resource, http factory).
+        """
+        if self._rest_service is None:
+            import google.auth
+            import google_auth_httplib2
+            import httplib2
+            from googleapiclient import discovery
+
+            credentials, _ = google.auth.default()
+            service = discovery.build("backupdr", "v1", credentials=credentials, cache_discovery=False)
+            backups = service.projects().locations().backupVaults().dataSources().backups()
+
+            def new_http():
+                # httplib2 connections are not thread safe, so each batch gets its own.
+                return google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+
+            self._rest_service = (service, backups, new_http)
+        return self._rest_service
 
     def _generate_curl_command(self, backup_name, new_expire_time):
         return f"""
@@ -186,27 +841,22 @@ curl -X PATCH \\
 
     def _update_backup_expiration(self, backup_name, new_expire_time):
         try:
-            self.logger.info(f"Updating {backup_name} to {new_expire_time}...")
-            
-            backup = backupdr_v1.Backup()
-            # Parse isoformat back to timestamp for protobuf?
-            # actually the client library expects keys.
+            self.logger.info(f"Updating {backup_name} to {new_expire_time.isoformat()}...")
             
-            # The python client typically needs a Timestamp object or similar.
-            # but let's see if we can just pass the dictionary or object.
+            # The python client accepts a datetime for Timestamp fields.
             # UpdateMask is required.
             
             # Direct API call via client
             request = backupdr_v1.UpdateBackupRequest(
                 backup=backupdr_v1.Backup(
                     name=backup_name,
-                    expire_time=parser.parse(new_expire_time)
+                    expire_time=new_expire_time
                 ),
                 update_mask="expireTime"
             )
             
-            operation = self.client.update_backup(request=request)
-            result = operation.result() # Wait for completion
+            operation = self._call("update_backup", backup_name, request)
+            result = operation.result(timeout=LRO_TIMEOUT_SECONDS) # Wait for completion
             self.logger.info(f"Successfully updated {backup_name}")
             
         except Exception as e: